@@ -1,12 +1,63 @@
-from django.contrib import admin
+from typing import List
+
+from django import forms
+from django.contrib import admin, messages
+from django.db import OperationalError
+from django.http import HttpResponseRedirect
 from django_access_control.admin import ConfidentialModelAdmin
 
-from questions.models import Question
+from questions.models import Question, StaleQuestionError
+
+STALE_QUESTION_MESSAGE = "This question has been changed by someone else since you opened it, so your changes were " \
+                         "not saved. The form now shows the current version, please apply your changes again."
+
+
+class QuestionAdminForm(forms.ModelForm):
+    # The version of the question the editor started from, round-tripped through the change form
+    loaded_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["loaded_version"].initial = self.instance.version
+        # Without the version there is nothing to check a change against
+        self.fields["loaded_version"].required = self.instance.pk is not None
 
 
 @admin.register(Question)
 class QuestionAdmin(ConfidentialModelAdmin):
+    form = QuestionAdminForm
+
+    def get_fields(self, request, obj=None) -> List[str]:
+        fields = super().get_fields(request, obj)
+        # Only editors submit the form, so only they need to carry the version they started from
+        if obj is not None and self.permissions.changeable_fields(request.user, obj):
+            fields = [*fields, "loaded_version"]
+        return fields
 
     def save_model(self, request, obj, form, change):
-        if not change: obj.author = request.user  # `not change` means the obj is added, not modified
-        super().save_model(request, obj, form, change)
+        """
+        Added questions are saved as usual. Changes go around `obj.save()` and only write the fields that changed and
+        the user may change, checking `loaded_version` in the same statement, see `Question.save_changed_fields`.
+
+        A change that does not touch any field writes nothing, so it neither checks nor bumps the version, and
+        `log_change` does not record it.
+        """
+        if not change:  # `not change` means the obj is added, not modified
+            obj.author = request.user
+            return super().save_model(request, obj, form, change)
+        changed_fields = self.permissions.changeable_fields(request.user, obj) & frozenset(form.changed_data)
+        obj.save_changed_fields(changed_fields, form.cleaned_data["loaded_version"])
+
+    def log_change(self, request, object, message):
+        if not message: return None  # nothing was written, see `save_model`
+        return super().log_change(request, object, message)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except (StaleQuestionError, OperationalError) as error:
+            # SQLite has no row locks, so there a concurrent save shows up as a locked database instead
+            if isinstance(error, OperationalError) and "database is locked" not in str(error): raise
+            # The admin's transaction has been rolled back, the change page shows the current version again
+            self.message_user(request, STALE_QUESTION_MESSAGE, messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-from typing import FrozenSet, Set
+from typing import FrozenSet, Iterable, Set
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models import QuerySet
+from django.db import models, transaction
+from django.db.models import F, QuerySet
 from django_access_control.models import all_field_names
 from django_access_control.querysets import ConfidentialQuerySet
 
 
+class StaleQuestionError(Exception):
+    """
+    Raised when a question is saved from a version that is no longer the current one.
+    """
+
+
 class QuestionQuerySet(ConfidentialQuerySet):
     def has_table_wide_add_permission(self, user: AbstractUser) -> bool:
         print("Add permission", user.is_authenticated)
@@ -52,9 +58,46 @@ class Question(models.Model):
     body = models.TextField()
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     is_published = models.BooleanField(default=True)
+    # Bumped on every change by both `save` and `save_changed_fields`, used for optimistic locking.
+    # Not editable, so it is not part of `all_field_names`.
+    version = models.PositiveIntegerField(default=0, editable=False)
 
     objects = QuestionQuerySet.as_manager()
     default_confidential_manager = ConfidentialQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.title
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        """
+        Moves `version` on with every update, so forms opened before this write are rejected as stale.
+
+        Unlike `save_changed_fields` this does not check the version it started from. The `version` held by the
+        instance is never written, as it may be outdated; the row's version is bumped by a separate `UPDATE` and is
+        not read back, call `refresh_from_db` to get it.
+        """
+        if self._state.adding or force_insert or (update_fields is not None and not update_fields):
+            return super().save(force_insert, force_update, using, update_fields)
+        if update_fields is None:
+            update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+        update_fields = [name for name in update_fields if name != "version"]
+        with transaction.atomic(using=using):
+            super().save(force_insert, force_update, using, update_fields)
+            Question.objects.using(using).filter(pk=self.pk).update(version=F("version") + 1)
+
+    def save_changed_fields(self, field_names: Iterable[str], expected_version: int) -> None:
+        """
+        Write only `field_names` to the database, provided the row is still at `expected_version`.
+
+        The version check and the write happen in a single `UPDATE`, so two editors starting from the same version
+        cannot both succeed. Raises `StaleQuestionError` if somebody else saved the question in the meantime.
+
+        The write goes through `QuerySet.update`, so `pre_save` and `post_save` signals are not sent.
+        """
+        attnames = {self._meta.get_field(name).attname for name in field_names}
+        if not attnames: return
+        updated = Question.objects.filter(pk=self.pk, version=expected_version).update(
+            version=F("version") + 1, **{attname: getattr(self, attname) for attname in attnames})
+        if not updated:
+            raise StaleQuestionError(f"Question {self.pk} is no longer at version {expected_version}")
+        self.version = expected_version + 1
@@ -1,7 +1,15 @@
+import threading
+from unittest import mock
+
 from bs4 import BeautifulSoup
+from django.contrib.admin.models import LogEntry
 from django.contrib.auth.models import User
-from django.test import TestCase, Client
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
 
+from questions.admin import QuestionAdminForm
 from questions.models import Question
 
 
@@ -124,3 +132,168 @@ class ChangeViewTest(BaseAdminTestCase):
         self.assertInHTML(
             '<input type="checkbox" name="is_published" id="id_is_published" checked="">'
             '<label class="vCheckboxLabel" for="id_is_published">Is published</label>', table)
+
+
+class ChangeViewSaveTest(BaseAdminTestCase):
+    CHANGE_VIEW_URL = "/questions/question/{}/change/"
+    STALE_MESSAGE = "This question has been changed by someone else"
+
+    def post_change(self, client: Client, question: Question, **data):
+        return client.post(self.CHANGE_VIEW_URL.format(question.pk), {"_save": "Save", **data}, follow=True)
+
+    @staticmethod
+    def get_resubmittable_data(response):
+        """
+        The data the browser would submit when the change form on the page is saved.
+        """
+        form = BeautifulSoup(response.content, 'html.parser').find(id="question_form")
+        data = {i["name"]: i.get("value", "") for i in form.find_all("input") if i.get("type") != "checkbox"}
+        data.update({i["name"]: "on" for i in form.find_all("input", type="checkbox") if i.has_attr("checked")})
+        data.update({t["name"]: t.text.strip() for t in form.find_all("textarea")})
+        return data
+
+    def test_author_saves_only_the_body(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post_change(self.user_1_client, self.question_1, body="New body", loaded_version=0)
+        updates = [q["sql"] for q in queries if q["sql"].startswith("UPDATE \"questions_question\"")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"body"', updates[0])
+        self.assertNotIn('"title"', updates[0])
+        self.assertNotIn('"is_published"', updates[0])
+        self.question_1.refresh_from_db()
+        self.assertEqual(self.question_1.body, "New body")
+        self.assertEqual(self.question_1.version, 1)
+
+    def test_staff_publishing_does_not_rewrite_the_body(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post_change(self.staff_member_client, self.question_1, loaded_version=0)  # unchecks `is_published`
+        updates = [q["sql"] for q in queries if q["sql"].startswith("UPDATE \"questions_question\"")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"is_published"', updates[0])
+        self.assertNotIn('"body"', updates[0])
+        self.question_1.refresh_from_db()
+        self.assertFalse(self.question_1.is_published)
+
+    def test_save_without_changes_is_not_logged(self):
+        self.post_change(self.staff_member_client, self.question_1, is_published="on", loaded_version=0)
+        self.question_1.refresh_from_db()
+        self.assertEqual(self.question_1.version, 0)
+        self.assertFalse(LogEntry.objects.exists())
+
+    def test_stale_form_is_rejected(self):
+        # The author saves first, then the staff member submits the form they opened before that
+        self.post_change(self.user_1_client, self.question_1, body="New body", loaded_version=0)
+        response = self.post_change(self.staff_member_client, self.question_1, loaded_version=0)
+        self.assertRedirects(response, self.CHANGE_VIEW_URL.format(self.question_1.pk))
+        self.assertContains(response, self.STALE_MESSAGE)
+        self.question_1.refresh_from_db()
+        self.assertTrue(self.question_1.is_published)
+        self.assertEqual(self.question_1.body, "New body")
+
+        # The page that came back shows the current version, so saving it again goes through
+        data = self.get_resubmittable_data(response)
+        self.assertEqual(data["loaded_version"], "1")
+        self.assertEqual(data["is_published"], "on")
+        del data["is_published"]  # the staff member unchecks `is_published` again
+        self.staff_member_client.post(self.CHANGE_VIEW_URL.format(self.question_1.pk), data, follow=True)
+        self.question_1.refresh_from_db()
+        self.assertFalse(self.question_1.is_published)
+        self.assertEqual(self.question_1.body, "New body")
+        self.assertEqual(self.question_1.version, 2)
+
+    def test_stale_form_of_the_author_shows_the_current_body(self):
+        Question.objects.filter(pk=self.question_1.pk).update(body="Edited elsewhere", version=1)
+        response = self.post_change(self.user_1_client, self.question_1, body="New body", loaded_version=0)
+        self.assertContains(response, self.STALE_MESSAGE)
+        data = self.get_resubmittable_data(response)
+        self.assertEqual(data["body"], "Edited elsewhere")
+        self.assertEqual(data["loaded_version"], "1")
+
+    def test_field_errors_come_before_the_version_check(self):
+        Question.objects.filter(pk=self.question_1.pk).update(version=1)
+        response = self.post_change(self.user_1_client, self.question_1, body="", loaded_version=0)
+        self.assertContains(response, "This field is required.")
+        self.assertNotContains(response, self.STALE_MESSAGE)
+
+    def test_change_without_version_is_rejected(self):
+        response = self.post_change(self.user_1_client, self.question_1, body="New body")
+        self.assertContains(response, "This field is required.")
+        self.assertNotContains(response, self.STALE_MESSAGE)  # nobody else changed the question
+        self.question_1.refresh_from_db()
+        self.assertEqual(self.question_1.body, "Foo bar")
+        self.assertEqual(self.question_1.version, 0)
+
+    def test_save_losing_the_race_is_rolled_back(self):
+        original_clean = QuestionAdminForm.clean
+
+        def clean_then_concurrent_save(form):
+            # Someone else saves between the form validation and our write
+            cleaned_data = original_clean(form)
+            Question.objects.filter(pk=form.instance.pk).update(title="Edited elsewhere", version=F("version") + 1)
+            return cleaned_data
+
+        with mock.patch.object(QuestionAdminForm, "clean", clean_then_concurrent_save):
+            response = self.post_change(self.user_1_client, self.question_1, body="New body", loaded_version=0)
+        self.assertRedirects(response, self.CHANGE_VIEW_URL.format(self.question_1.pk))
+        self.assertContains(response, self.STALE_MESSAGE)
+        self.question_1.refresh_from_db()
+        self.assertEqual(self.question_1.body, "Foo bar")
+        self.assertFalse(LogEntry.objects.exists())
+
+    def test_only_editors_get_the_version_field(self):
+        form = ChangeViewTest.get_change_page_form(self.user_1_client, self.question_1.pk)
+        self.assertInHTML('<input type="hidden" name="loaded_version" value="0" id="id_loaded_version">', form)
+        form = ChangeViewTest.get_change_page_form(self.anonymous_client, self.question_1.pk)
+        self.assertNotIn("loaded_version", form)
+
+
+class ConcurrentChangeViewTest(TransactionTestCase):
+    """
+    Submits change forms from several threads against the file-backed test database, each request in its own
+    connection and transaction.
+    """
+    CHANGE_VIEW_URL = "/questions/question/{}/change/"
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="xxx")
+        User.objects.create_user(username="staff", password="xxx", is_staff=True)
+        self.question = Question.objects.create(title="Lorem", body="Foo bar", author=self.author)
+
+    def submit_concurrently(self, *submissions):
+        """
+        Logs in every user, then posts all the change forms at once. Returns the responses in submission order.
+        """
+        clients = []
+        for username, _ in submissions:
+            client = Client()
+            client.login(username=username, password="xxx")
+            clients.append(client)
+        barrier = threading.Barrier(len(submissions))
+        responses = [None] * len(submissions)
+
+        def submit(i, client, data):
+            try:
+                barrier.wait()
+                responses[i] = client.post(self.CHANGE_VIEW_URL.format(self.question.pk), {"_save": "Save", **data})
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit, args=(i, client, data))
+                   for i, (client, (_, data)) in enumerate(zip(clients, submissions))]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        return responses
+
+    def test_concurrent_change_forms(self):
+        # The author and a moderator submit the forms they both opened at version 0
+        responses = self.submit_concurrently(
+            ("author", {"body": "Dolor sit amet.", "loaded_version": 0}),
+            ("staff", {"loaded_version": 0}),  # unchecks `is_published`
+        )
+        # Both are redirected, one to the question list after saving, the other back to the stale form
+        self.assertEqual(sorted(r["Location"] for r in responses),
+                         ["/questions/question/", self.CHANGE_VIEW_URL.format(self.question.pk)])
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.version, 1)
+        self.assertNotEqual(self.question.body == "Dolor sit amet.", self.question.is_published is False)
+        self.assertEqual(LogEntry.objects.count(), 1)
@@ -0,0 +1,105 @@
+import threading
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TransactionTestCase
+
+from .models import Question, StaleQuestionError
+
+
+class SaveChangedFieldsTest(TransactionTestCase):
+    """
+    Runs against the file-backed test database, so every thread gets its own connection.
+    """
+
+    def setUp(self):
+        self.author = User.objects.create_user("author")
+        self.question = Question.objects.create(title="Ipsum?", body="Lorem ipsum.", author=self.author)
+
+    def edit_concurrently(self, *edits):
+        """
+        Loads the question in one thread per edit, waits until all of them have loaded it, then saves the edits at once.
+
+        Returns the number of edits that were rejected as stale.
+        """
+        barrier = threading.Barrier(len(edits))
+        stale = []
+
+        def edit(field_name, value):
+            try:
+                question = Question.objects.get(pk=self.question.pk)
+                barrier.wait()
+                setattr(question, field_name, value)
+                question.save_changed_fields({field_name}, question.version)
+            except StaleQuestionError:
+                stale.append(field_name)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=edit, args=e) for e in edits]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        return len(stale)
+
+    def test_only_changed_fields_are_written(self):
+        self.question.body = "Dolor sit amet."
+        Question.objects.filter(pk=self.question.pk).update(title="Changed elsewhere")
+        self.question.save_changed_fields({"body"}, 0)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.body, "Dolor sit amet.")
+        self.assertEqual(self.question.title, "Changed elsewhere")  # not overwritten with the stale in-memory title
+        self.assertEqual(self.question.version, 1)
+
+    def test_stale_version_is_rejected(self):
+        self.question.body = "Dolor sit amet."
+        self.question.save_changed_fields({"body"}, 0)
+        self.question.is_published = False
+        with self.assertRaises(StaleQuestionError):
+            self.question.save_changed_fields({"is_published"}, 0)
+        self.question.refresh_from_db()
+        self.assertTrue(self.question.is_published)
+        self.assertEqual(self.question.version, 1)
+
+    def test_nothing_is_written_without_changes(self):
+        self.question.save_changed_fields(set(), 0)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.version, 0)
+
+    def test_save_bumps_the_version(self):
+        self.question.title = "Dolor?"
+        self.question.save()
+        self.question.save(update_fields=["title"])
+        self.assertEqual(self.question.version, 0)  # the instance is not refreshed
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.version, 2)
+        # A form opened before these writes is now stale
+        with self.assertRaises(StaleQuestionError):
+            self.question.save_changed_fields({"body"}, 0)
+
+    def test_save_does_not_write_an_outdated_version(self):
+        outdated = Question.objects.get(pk=self.question.pk)
+        self.question.save()
+        self.question.save()
+        outdated.save()
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.version, 3)
+
+    def test_save_without_update_fields_writes_nothing(self):
+        with self.assertNumQueries(0):
+            self.question.save(update_fields=[])
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.version, 0)
+
+    def test_concurrent_edits_from_the_same_version(self):
+        # The author and a moderator open the question at the same time, only the first save may go through
+        stale = self.edit_concurrently(("body", "Dolor sit amet."), ("is_published", False))
+        self.assertEqual(stale, 1)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.version, 1)
+        self.assertNotEqual(self.question.body == "Dolor sit amet.", self.question.is_published is False)
+
+    def test_many_concurrent_edits(self):
+        stale = self.edit_concurrently(*[("body", f"Edit {i}") for i in range(8)])
+        self.assertEqual(stale, 7)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.version, 1)